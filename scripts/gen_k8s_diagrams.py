@@ -1,57 +1,163 @@
 #!/usr/bin/env python3
-import argparse, json, os, sys, glob, yaml
+import argparse, json, os, re, sys, glob, yaml
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+# libyaml-backed loader is several times faster on large manifests; it needs a
+# PyYAML built against libyaml (pip install --no-binary :all: pyyaml if the
+# wheel for your platform lacks it). Falls back to the pure-Python loader.
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+# ijson streams `kubectl get -o json` dumps item by item instead of building the
+# whole document in memory first; plain json is used when it isn't installed.
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# without ijson the whole dump is parsed at once; orjson does that much faster
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+class Obj:
+    # compact record holding only the fields the diagrams read
+    __slots__ = ("ns", "name", "kind", "labels", "selector", "rules", "owners")
+
+    def __init__(self, ns, name, kind, labels, selector, rules, owners):
+        self.ns, self.name, self.kind = ns, name, kind
+        self.labels, self.selector, self.rules, self.owners = labels, selector, rules, owners
+
+def project(obj):
+    if not isinstance(obj, dict) or "kind" not in obj or "metadata" not in obj:
+        return None
+    meta = obj.get("metadata") or {}
+    spec = obj.get("spec") or {}
+    if not isinstance(spec, dict):
+        spec = {}
+    return Obj(meta.get("namespace", "default"), meta.get("name", ""), obj["kind"],
+               meta.get("labels") or {}, spec.get("selector") or {},
+               spec.get("rules") or [], meta.get("ownerReferences") or [])
+
+def iter_json(path):
+    if ijson is None:
+        with open(path, "rb") as f:
+            data = _loads(f.read())
+        items = data.get("items", [])
+        # single object json
+        yield from items or [data]
+        return
+    # one pass over the events: each items[] entry is built and yielded on its
+    # own, everything else goes into the (small) top-level object
+    with open(path, "rb") as f:
+        top = ijson.ObjectBuilder()
+        item = None
+        found = False
+        for prefix, event, value in ijson.parse(f):
+            if item is None and prefix == "items.item" and event in ("start_map", "start_array"):
+                item = ijson.ObjectBuilder()
+            if item is not None:
+                item.event(event, value)
+                if prefix == "items.item" and event in ("end_map", "end_array"):
+                    found = True
+                    yield item.value
+                    item = None
+            elif prefix != "items" and not prefix.startswith("items."):
+                top.event(event, value)
+        if not found:
+            # single object json
+            yield top.value
+
+# document separators at column 0, used only for the JSON fast path
+_DOC_SEP = re.compile(rb"^---[ \t]*\r?$", re.M)
+
+def load_docs(data):
+    # many generated manifests are JSON, alone or between --- separators; use
+    # the JSON parser when the whole stream is JSON, otherwise hand the
+    # unsplit stream to YAML so directives and odd framing still work
+    try:
+        return [_loads(data)]
+    except ValueError:
+        pass
+    try:
+        return [_loads(chunk) for chunk in _DOC_SEP.split(data) if chunk.strip()]
+    except ValueError:
+        return yaml.load_all(data, Loader=SafeLoader)
+
+# below this many files --dir is parsed in-process: with one file per task a
+# smaller directory can't keep more than a couple of workers busy, so the pool
+# start-up costs more than it saves
+_MIN_PARALLEL_FILES = 4
+
+def parse_file(path):
+    # runs in a worker process: parse and trim one manifest file
+    with open(path, "rb") as f:
+        data = f.read()
+    return [o for o in map(project, load_docs(data)) if o is not None]
 
 def load_objects(args):
     objs = []
+    docs = []
     if args.json:
-        with open(args.json) as f:
-            data = json.load(f)
-        items = data.get("items", [])
-        if items:
-            objs.extend(items)
-        else:
-            # single object json
-            objs.append(data)
+        docs = iter_json(args.json)
     if args.yaml:
-        with open(args.yaml) as f:
-            for doc in yaml.safe_load_all(f):
-                if doc:
-                    objs.append(doc)
+        with open(args.yaml, "rb") as f:
+            docs = load_docs(f.read())
     if args.dir:
-        for path in glob.glob(os.path.join(args.dir, "*.y*ml")):
-            with open(path) as f:
-                for doc in yaml.safe_load_all(f):
-                    if doc:
-                        objs.append(doc)
-    # normalize: ensure required fields
-    norm = []
-    for o in objs:
-        if not isinstance(o, dict): continue
-        if "kind" in o and "metadata" in o:
-            norm.append(o)
-    return norm
-
-def ns(obj): return obj.get("metadata", {}).get("namespace", "default")
-def name(obj): return obj.get("metadata", {}).get("name", "")
-def kind(obj): return obj.get("kind", "")
+        paths = glob.glob(os.path.join(args.dir, "*.y*ml"))
+        if len(paths) < _MIN_PARALLEL_FILES:
+            # a pool costs more to start than a handful of files take to parse
+            for path in paths:
+                objs.extend(parse_file(path))
+        else:
+            # YAML parsing holds the GIL, so spread files across processes
+            # (Windows rejects more than 61 workers)
+            workers = min(len(paths), os.cpu_count() or 1, 61)
+            # about four tasks per worker: every worker gets files and the
+            # IPC cost is still amortized over large directories
+            chunksize = max(1, len(paths) // (workers * 4))
+            with ProcessPoolExecutor(max_workers=workers) as ex:
+                for parsed in ex.map(parse_file, paths, chunksize=chunksize):
+                    objs.extend(parsed)
+    # normalize: keep objects with the required fields, trimmed to what we read
+    for o in docs:
+        o = project(o)
+        if o is not None:
+            objs.append(o)
+    return objs
 
-def label_map(obj): return obj.get("metadata", {}).get("labels", {}) or {}
 def selector_map(obj):
-    sel = obj.get("spec", {}).get("selector", {})
+    sel = obj.selector
     if isinstance(sel, dict):
         # deployments have .spec.selector.matchLabels
         return sel.get("matchLabels", sel) or {}
     return {}
 
 def svc_selector(obj):
-    sel = obj.get("spec", {}).get("selector", {})
-    return sel or {}
+    return obj.selector or {}
 
 def workload_type(k):
     return k in ("Deployment","StatefulSet","DaemonSet","Job","CronJob")
 
-def obj_key(obj): return f"{ns(obj)}:{kind(obj)}:{name(obj)}"
+def obj_key(obj): return f"{obj.ns}:{obj.kind}:{obj.name}"
+
+# ---------- High-level (C4 Context) template ----------
+C4_CONTEXT = """@startuml
+!include https://raw.githubusercontent.com/plantuml-stdlib/C4-PlantUML/master/C4_Context.puml
+title System Context - Your Platform
+
+Person(user, "User", "Human using the platform")
+System_Boundary(sys, "Your Platform") {
+  System(system, "Kubernetes-based Data Platform", "Ingestion, Processing, Inference, Visualization")
+}
+Rel(user, system, "Uses", "HTTPS")
+@enduml
+"""
 
 def main():
     ap = argparse.ArgumentParser()
@@ -74,7 +180,7 @@ def main():
     endpoints = []
 
     for o in objs:
-        k = kind(o)
+        k = o.kind
         if workload_type(k):
             workloads.append(o)
         elif k == "Service":
@@ -87,126 +193,120 @@ def main():
             endpoints.append(o)
 
     # Build selectors → workload matches
-    wl_by_ns = defaultdict(list)
-    for w in workloads:
-        wl_by_ns[ns(w)].append(w)
+    # (ns, label, value) -> workload positions; a service matches the
+    # intersection of the sets for its selector entries
+    pair_index = defaultdict(set)
+    for i, w in enumerate(workloads):
+        n = w.ns
+        for k, v in w.labels.items():
+            pair_index[(n, k, v)].add(i)
 
     svc_backends = defaultdict(list)  # svc_key -> [workload names]
     for s in services:
         sel = svc_selector(s)
         if not sel: 
             continue
-        n = ns(s)
-        candidates = wl_by_ns.get(n, [])
-        for w in candidates:
-            wl_labels = label_map(w)
-            if all(wl_labels.get(k) == v for k, v in sel.items()):
-                svc_backends[obj_key(s)].append(w)
-
-    # ---------- High-level (C4 Context) template ----------
-    c4_ctx = """@startuml
-!include https://raw.githubusercontent.com/plantuml-stdlib/C4-PlantUML/master/C4_Context.puml
-title System Context - Your Platform
+        n = s.ns
+        # rarest selector entry first so the running set is small and an
+        # unmatched selector stops after one lookup
+        sets = sorted((pair_index.get((n, k, v), set()) for k, v in sel.items()), key=len)
+        matched = sets[0]
+        for other in sets[1:]:
+            if not matched:
+                break
+            matched = matched & other
+        for i in sorted(matched):
+            svc_backends[obj_key(s)].append(workloads[i])
 
-Person(user, "User", "Human using the platform")
-System_Boundary(sys, "Your Platform") {
-  System(system, "Kubernetes-based Data Platform", "Ingestion, Processing, Inference, Visualization")
-}
-Rel(user, system, "Uses", "HTTPS")
-@enduml
-"""
-    open(os.path.join(args.outdir, "c4-context.puml"), "w").write(c4_ctx)
-
-    # ---------- Mid-level (C4 Container) ----------
-    # Namespaces as containers; Services and Workloads as components
-    by_ns = defaultdict(lambda: {"services":[], "workloads":[]})
-    for s in services:  by_ns[ns(s)]["services"].append(s)
-    for w in workloads: by_ns[ns(w)]["workloads"].append(w)
-
-    lines = []
-    lines.append("@startuml")
-    lines.append('!include https://raw.githubusercontent.com/plantuml-stdlib/C4-PlantUML/master/C4_Container.puml')
-    lines.append('title Container View - Namespaces, Services, Workloads')
-    lines.append('System_Boundary(k8s, "Kubernetes Cluster") {')
-    for namespace, grp in sorted(by_ns.items()):
-        lines.append(f'  Container_Boundary(ns_{namespace}, "Namespace: {namespace}") {{')
-        for s in grp["services"]:
-            lines.append(f'    Container(svc_{name(s)}_{namespace}, "Service: {name(s)}", "K8s Service")')
-        for w in grp["workloads"]:
-            lines.append(f'    Container(wl_{name(w)}_{namespace}, "{kind(w)}: {name(w)}", "K8s Workload")')
-        lines.append('  }')
-    # Edges: Service -> Workload (backends), Ingress -> Service
-    for s in services:
-        skey = obj_key(s)
-        for w in svc_backends.get(skey, []):
-            lines.append(f'Rel(svc_{name(s)}_{ns(s)}, wl_{name(w)}_{ns(w)}, "routes to")')
+    # Ingress -> backend service, parsed once for both diagrams
+    # (best-effort parse of backend services, v1 Ingress)
+    ingress_edges = []  # (ingress, namespace, service name)
     for ing in ingresses:
-        # ingress → the service(s) in rules
-        ns_ing = ns(ing)
-        rules = ing.get("spec", {}).get("rules", [])
-        # best-effort parse of backend services (v1 Ingress)
-        for r in rules:
+        ns_ing = ing.ns
+        for r in ing.rules:
             paths = r.get("http", {}).get("paths", [])
             for p in paths:
                 b = p.get("backend", {})
                 svc = b.get("service", {})
                 svcname = svc.get("name")
                 if svcname:
-                    lines.append(f'Boundary(ing_{name(ing)}_{ns_ing}, "Ingress: {name(ing)}")')
-                    lines.append(f'Rel(ing_{name(ing)}_{ns_ing}, svc_{svcname}_{ns_ing}, "forwards")')
-    lines.append("}")
-    lines.append("@enduml")
-    open(os.path.join(args.outdir, "c4-container.puml"), "w").write("\n".join(lines))
-
-    # ---------- Low-level (K8s topology) ----------
-    # Use generic nodes/edges; optionally expand to pods
-    low = []
-    low.append("@startuml")
-    low.append("title Kubernetes Topology - Services ↔ Workloads")
-    low.append("skinparam linetype ortho")
-
-    def n_id(prefix, o): return f'{prefix}_{name(o)}_{ns(o)}'
-    for s in services:
-        low.append(f'node "{ns(s)}/svc/{name(s)}" as {n_id("svc",s)}')
-    for w in workloads:
-        low.append(f'component "{ns(w)}/{kind(w)}/{name(w)}" as {n_id("wl",w)}')
-    if args.include_pods:
-        for p in pods:
-            low.append(f'() "{ns(p)}/pod/{name(p)}" as {n_id("pod",p)}')
+                    ingress_edges.append((ing, ns_ing, svcname))
 
-    for s in services:
-        skey = obj_key(s)
-        for w in svc_backends.get(skey, []):
-            low.append(f'{n_id("svc",s)} --> {n_id("wl",w)} : routes')
-
-    # naive pod link: pod ownerReference to workload (best-effort)
-    if args.include_pods:
-        for p in pods:
-            owners = p.get("metadata", {}).get("ownerReferences", []) or []
-            for oref in owners:
-                oname = oref.get("name")
-                okind = oref.get("kind")
-                # link if we find matching workload
-                for w in workloads:
-                    if ns(w) == ns(p) and name(w) == oname and kind(w) == okind:
-                        low.append(f'{n_id("wl",w)} --> {n_id("pod",p)} : controls')
-
-    # ingress links already done in mid-level; repeat here as nodes
-    for ing in ingresses:
-        low.append(f'cloud "{ns(ing)}/ing/{name(ing)}" as {n_id("ing",ing)}')
-        ns_ing = ns(ing)
-        rules = ing.get("spec", {}).get("rules", [])
-        for r in rules:
-            paths = r.get("http", {}).get("paths", [])
-            for p in paths:
-                b = p.get("backend", {})
-                svc = b.get("service", {})
-                svcname = svc.get("name")
-                if svcname:
-                    low.append(f'{n_id("ing",ing)} --> svc_{svcname}_{ns_ing} : forwards')
+    with open(os.path.join(args.outdir, "c4-context.puml"), "w") as ctx_out, \
+         open(os.path.join(args.outdir, "c4-container.puml"), "w", buffering=1 << 20) as container_out, \
+         open(os.path.join(args.outdir, "k8s-topology.puml"), "w", buffering=1 << 20) as topo_out:
+        ctx_out.write(C4_CONTEXT)
+
+        # ---------- Mid-level (C4 Container) ----------
+        # Namespaces as containers; Services and Workloads as components
+        by_ns = defaultdict(lambda: {"services":[], "workloads":[]})
+        for s in services:  by_ns[s.ns]["services"].append(s)
+        for w in workloads: by_ns[w.ns]["workloads"].append(w)
+
+        container_out.write("@startuml\n")
+        container_out.write('!include https://raw.githubusercontent.com/plantuml-stdlib/C4-PlantUML/master/C4_Container.puml\n')
+        container_out.write('title Container View - Namespaces, Services, Workloads\n')
+        container_out.write('System_Boundary(k8s, "Kubernetes Cluster") {\n')
+        for namespace, grp in sorted(by_ns.items()):
+            container_out.write(f'  Container_Boundary(ns_{namespace}, "Namespace: {namespace}") {{\n')
+            for s in grp["services"]:
+                container_out.write(f'    Container(svc_{s.name}_{namespace}, "Service: {s.name}", "K8s Service")\n')
+            for w in grp["workloads"]:
+                container_out.write(f'    Container(wl_{w.name}_{namespace}, "{w.kind}: {w.name}", "K8s Workload")\n')
+            container_out.write('  }\n')
+        # Edges: Service -> Workload (backends), Ingress -> Service
+        for s in services:
+            skey = obj_key(s)
+            for w in svc_backends.get(skey, []):
+                container_out.write(f'Rel(svc_{s.name}_{s.ns}, wl_{w.name}_{w.ns}, "routes to")\n')
+        # ingress → the service(s) in rules; one Boundary per ingress
+        last = None
+        for ing, ns_ing, svcname in ingress_edges:
+            if ing is not last:
+                container_out.write(f'Boundary(ing_{ing.name}_{ns_ing}, "Ingress: {ing.name}")\n')
+                last = ing
+            container_out.write(f'Rel(ing_{ing.name}_{ns_ing}, svc_{svcname}_{ns_ing}, "forwards")\n')
+        container_out.write("}\n")
+        container_out.write("@enduml\n")
+
+        # ---------- Low-level (K8s topology) ----------
+        # Use generic nodes/edges; optionally expand to pods
+        topo_out.write("@startuml\n")
+        topo_out.write("title Kubernetes Topology - Services ↔ Workloads\n")
+        topo_out.write("skinparam linetype ortho\n")
+
+        for s in services:
+            topo_out.write(f'node "{s.ns}/svc/{s.name}" as svc_{s.name}_{s.ns}\n')
+        for w in workloads:
+            topo_out.write(f'component "{w.ns}/{w.kind}/{w.name}" as wl_{w.name}_{w.ns}\n')
+        if args.include_pods:
+            for p in pods:
+                topo_out.write(f'() "{p.ns}/pod/{p.name}" as pod_{p.name}_{p.ns}\n')
+
+        for s in services:
+            skey = obj_key(s)
+            for w in svc_backends.get(skey, []):
+                topo_out.write(f'svc_{s.name}_{s.ns} --> wl_{w.name}_{w.ns} : routes\n')
+
+        # naive pod link: pod ownerReference to workload (best-effort)
+        if args.include_pods:
+            wl_index = {(w.ns, w.kind, w.name): w for w in workloads}
+            for p in pods:
+                for oref in p.owners:
+                    oname = oref.get("name")
+                    okind = oref.get("kind")
+                    # link if we find matching workload
+                    w = wl_index.get((p.ns, okind, oname))
+                    if w is not None:
+                        topo_out.write(f'wl_{w.name}_{w.ns} --> pod_{p.name}_{p.ns} : controls\n')
+
+        # ingress links already done in mid-level; repeat here as nodes
+        for ing in ingresses:
+            topo_out.write(f'cloud "{ing.ns}/ing/{ing.name}" as ing_{ing.name}_{ing.ns}\n')
+        for ing, ns_ing, svcname in ingress_edges:
+            topo_out.write(f'ing_{ing.name}_{ns_ing} --> svc_{svcname}_{ns_ing} : forwards\n')
 
-    low.append("@enduml")
-    open(os.path.join(args.outdir, "k8s-topology.puml"), "w").write("\n".join(low))
+        topo_out.write("@enduml\n")
 
     print(f"Wrote {args.outdir}/c4-context.puml")
     print(f"Wrote {args.outdir}/c4-container.puml")